@@ -7,33 +7,52 @@ Copyright (c) 2026 Kiara Inc. | MIT License
 """
 
 import os
+import asyncio
 import re
 import sys
 import json
+import hashlib
+import http.client
 import subprocess
+import time
+import urllib.parse
 import urllib.request
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
-
-import anthropic
+from typing import IO, AsyncIterator, Iterator, Optional, Union
 
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
 
+
+def _env_bool(name: str, default: bool = True) -> bool:
+    """Read a boolean flag; 1/true/yes/on (any case) count as true."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 OUTPUT_DIR = os.environ.get("AUTODOC_OUTPUT_DIR", "docs/autodoc")
 LANGUAGE = os.environ.get("AUTODOC_LANGUAGE", "en")
-INCLUDE_API = os.environ.get("AUTODOC_INCLUDE_API", "true") == "true"
-INCLUDE_ARCH = os.environ.get("AUTODOC_INCLUDE_ARCH", "true") == "true"
-INCLUDE_ONBOARD = os.environ.get("AUTODOC_INCLUDE_ONBOARD", "true") == "true"
-INCLUDE_DECISIONS = os.environ.get("AUTODOC_INCLUDE_DECISIONS", "true") == "true"
-INCLUDE_CHANGELOG = os.environ.get("AUTODOC_INCLUDE_CHANGELOG", "true") == "true"
-DIFF_MODE = os.environ.get("AUTODOC_DIFF_MODE", "true") == "true"
+
+INCLUDE_API = _env_bool("AUTODOC_INCLUDE_API")
+INCLUDE_ARCH = _env_bool("AUTODOC_INCLUDE_ARCH")
+INCLUDE_ONBOARD = _env_bool("AUTODOC_INCLUDE_ONBOARD")
+INCLUDE_DECISIONS = _env_bool("AUTODOC_INCLUDE_DECISIONS")
+INCLUDE_CHANGELOG = _env_bool("AUTODOC_INCLUDE_CHANGELOG")
+DIFF_MODE = _env_bool("AUTODOC_DIFF_MODE")
 MAX_FILES = int(os.environ.get("AUTODOC_MAX_FILES", "50"))
-FILE_EXTENSIONS = os.environ.get(
-    "AUTODOC_FILE_EXTENSIONS", ".py,.ts,.tsx,.js,.jsx,.go,.rs,.java,.rb,.php"
-).split(",")
+FILE_EXTENSIONS = tuple(  # tuple so str.endswith can test them all in one call
+    ext.strip()
+    for ext in os.environ.get(
+        "AUTODOC_FILE_EXTENSIONS", ".py,.ts,.tsx,.js,.jsx,.go,.rs,.java,.rb,.php"
+    ).split(",")
+    if ext.strip()
+)
 WEBHOOK_URL = os.environ.get("AUTODOC_WEBHOOK_URL", "")
 
 # GitHub context (auto-set in GitHub Actions)
@@ -63,18 +82,34 @@ def get_repo_root() -> Path:
     return Path(result.stdout.strip())
 
 
-def get_changed_files(repo_root: Path) -> set[str]:
-    """Get files changed in the most recent commit."""
-    result = subprocess.run(
-        ["git", "diff", "HEAD~1", "--name-only"],
-        capture_output=True,
-        text=True,
+async def run_git(repo_root: Path, *args: str) -> tuple[int, bytes]:
+    """Run a git command without blocking the event loop; return (returncode, stdout)."""
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
         cwd=repo_root,
     )
-    if result.returncode != 0 or not result.stdout.strip():
+    stdout, _ = await proc.communicate()
+    return proc.returncode, stdout
+
+
+async def get_changed_files(repo_root: Path) -> set[str]:
+    """Get files changed in the most recent commit."""
+    returncode, stdout = await run_git(repo_root, "diff", "HEAD~1", "--name-only")
+    output = stdout.decode("utf-8", errors="replace").strip()
+    if returncode != 0 or not output:
         # First commit or error — treat as fully changed (regenerate all)
         return set()
-    return set(result.stdout.strip().splitlines())
+    return set(output.splitlines())
+
+
+# Config files whose changes make diff mode regenerate architecture/onboarding docs
+CONFIG_NAMES = frozenset({
+    "package.json", "pyproject.toml", "setup.py", "setup.cfg",
+    "Cargo.toml", "go.mod", "pom.xml", "build.gradle",
+    "Makefile", "Dockerfile", "docker-compose.yml", ".env.example",
+})
 
 
 def should_regenerate(doc_type: str, changed_files: set[str]) -> bool:
@@ -85,15 +120,9 @@ def should_regenerate(doc_type: str, changed_files: set[str]) -> bool:
     if not DIFF_MODE or not changed_files:
         return True
 
-    source_exts = tuple(ext.strip() for ext in FILE_EXTENSIONS)
-    config_names = {
-        "package.json", "pyproject.toml", "setup.py", "setup.cfg",
-        "Cargo.toml", "go.mod", "pom.xml", "build.gradle",
-        "Makefile", "Dockerfile", "docker-compose.yml", ".env.example",
-    }
-
-    has_source_changes = any(f.endswith(source_exts) for f in changed_files)
-    has_config_changes = any(Path(f).name in config_names for f in changed_files)
+    has_source_changes = any(f.endswith(FILE_EXTENSIONS) for f in changed_files)
+    # git paths always use "/", so a split is enough to get the file name
+    has_config_changes = any(f.rsplit("/", 1)[-1] in CONFIG_NAMES for f in changed_files)
 
     if doc_type == "architecture":
         return has_source_changes or has_config_changes
@@ -106,141 +135,279 @@ def should_regenerate(doc_type: str, changed_files: set[str]) -> bool:
     return True
 
 
-def scan_source_files(repo_root: Path) -> list[dict]:
-    """Scan repo for source files, return list of {path, content, size}."""
-    files = []
-    skip_dirs = {
-        ".git", "node_modules", "__pycache__", ".venv", "venv",
-        "dist", "build", ".next", ".autodoc", "docs/autodoc",
-        ".tox", ".mypy_cache", ".pytest_cache", "vendor",
-    }
+def _read_capped(fpath: Union[str, Path], limit: int) -> Optional[str]:
+    """
+    Read at most `limit` characters of a file as UTF-8, marking it if truncated.
+    Returns None for binary content (a NUL byte in the first 4 KB).
+    """
+    # UTF-8 is at most 4 bytes per character, so this always covers `limit` characters
+    with open(fpath, "rb", buffering=65536) as f:
+        raw = f.read(4 * limit + 1)
+    if b"\x00" in raw[:4096]:
+        return None
+    content = raw.decode("utf-8", errors="ignore")
+    if len(content) > limit or len(raw) > 4 * limit:
+        content = content[:limit] + "\n... [truncated]"
+    return content
 
-    for root, dirs, filenames in os.walk(repo_root):
-        dirs[:] = [d for d in dirs if d not in skip_dirs]
-        for fname in filenames:
-            if not any(fname.endswith(ext) for ext in FILE_EXTENSIONS):
-                continue
-            fpath = Path(root) / fname
-            rel_path = fpath.relative_to(repo_root)
-            try:
-                content = fpath.read_text(encoding="utf-8", errors="ignore")
-                if len(content) > 50_000:
-                    content = content[:50_000] + "\n... [truncated]"
-                files.append({
-                    "path": str(rel_path),
-                    "content": content,
-                    "size": fpath.stat().st_size,
-                })
-            except Exception as e:
-                print(f"  Skipping {rel_path}: {e}")
-
-            if len(files) >= MAX_FILES:
-                return files
-    return files
-
-
-def scan_config_files(repo_root: Path) -> list[dict]:
-    """Scan for config/metadata files that help understand the project."""
-    config_names = [
-        "package.json", "pyproject.toml", "setup.py", "setup.cfg",
-        "Cargo.toml", "go.mod", "pom.xml", "build.gradle",
-        "Makefile", "Dockerfile", "docker-compose.yml",
-        "README.md", "README.rst", ".env.example",
-    ]
-    configs = []
-    for name in config_names:
-        fpath = repo_root / name
-        if fpath.exists():
-            try:
-                content = fpath.read_text(encoding="utf-8", errors="ignore")
-                if len(content) > 10_000:
-                    content = content[:10_000] + "\n... [truncated]"
-                configs.append({"path": name, "content": content})
-            except Exception:
-                pass
-    return configs
-
-
-def get_git_log(repo_root: Path, max_commits: int = 50) -> str:
-    """Get recent git history with commit messages."""
-    result = subprocess.run(
-        [
-            "git", "log",
-            f"--max-count={max_commits}",
-            "--pretty=format:%h | %ad | %s",
-            "--date=short",
-        ],
-        capture_output=True,
-        text=True,
-        cwd=repo_root,
-    )
-    return result.stdout if result.returncode == 0 else ""
 
+# Characters of each source file that go into the prompt; longer files are marked truncated
+SOURCE_EXCERPT_CHARS = 4000
+
+
+def _read_source_file(repo_root: Path, rel_path: str) -> Optional[dict]:
+    """Read one source file, return {path, content} or None if unreadable or binary."""
+    fpath = os.path.join(repo_root, rel_path)
+    try:
+        content = _read_capped(fpath, SOURCE_EXCERPT_CHARS)
+        if content is None:
+            print(f"  Skipping {rel_path}: binary file")
+            return None
+        return {"path": rel_path, "content": content}
+    except Exception as e:
+        print(f"  Skipping {rel_path}: {e}")
+        return None
 
-def get_full_git_log(repo_root: Path, max_commits: int = 100) -> str:
-    """Get git log with full conventional commit detail for changelog generation."""
+
+# Minified bundles, lockfiles and generated stubs: they burn the MAX_FILES
+# budget and prompt tokens without saying anything about the design
+GENERATED_FILE_RE = re.compile(
+    r"\.min\.(?:js|css)$|\.bundle\.js$|\.lock$|-lock\.json$|_pb2(?:_grpc)?\.py$|\.pb\.go$"
+)
+
+
+def _read_config_file(repo_root: Path, name: str) -> Optional[dict]:
+    """Read one config file, return {path, content} or None if unreadable or binary."""
+    try:
+        content = _read_capped(os.path.join(repo_root, name), 10_000)
+    except Exception:
+        return None
+    if content is None:
+        return None
+    return {"path": name, "content": content}
+
+
+def list_repo_files(repo_root: Path) -> list[str]:
+    """
+    List tracked plus untracked-but-not-ignored files with one `git ls-files -z` call.
+    Paths are relative to repo_root; .gitignore'd build output never shows up.
+    """
     result = subprocess.run(
-        [
-            "git", "log",
-            f"--max-count={max_commits}",
-            "--pretty=format:%h | %ad | %an | %s%n%b---",
-            "--date=short",
-        ],
+        ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
         capture_output=True,
-        text=True,
         cwd=repo_root,
     )
-    return result.stdout if result.returncode == 0 else ""
+    if result.returncode != 0:
+        return []
+    return [os.fsdecode(p) for p in result.stdout.split(b"\x00") if p]
 
 
-def get_directory_tree(repo_root: Path, max_depth: int = 3) -> str:
-    """Generate a directory tree string."""
-    skip_dirs = {
+def scan_repo(
+    repo_root: Path, max_depth: int = 3, max_lines: int = 200
+) -> tuple[str, list[dict], list[dict]]:
+    """
+    Enumerate the repository once and return (tree, sources, configs).
+    The directory tree covers max_depth levels and max_lines lines; source collection
+    considers every depth until MAX_FILES candidates are found. Sources are
+    {path, content} dicts, configs are {path, content} dicts from the root.
+    """
+    tree_skip_dirs = {
         ".git", "node_modules", "__pycache__", ".venv", "venv",
-        "dist", "build", ".next",
+        "dist", "build", ".next", ".autodoc",
     }
-    lines = []
-
-    def _walk(path: Path, prefix: str, depth: int):
-        if depth > max_depth:
+    # Listed in the tree but their contents are not
+    scan_skip_dirs = tree_skip_dirs | {
+        ".tox", ".mypy_cache", ".pytest_cache", "vendor",
+    }
+    # AutoDoc's own output is left out entirely: listing it would change the
+    # repo context (and so every cache key) on the run after it is written
+    output_prefix = os.path.normpath(OUTPUT_DIR).replace(os.sep, "/") + "/"
+    config_names = [
+        "package.json", "pyproject.toml", "setup.py", "setup.cfg",
+        "Cargo.toml", "go.mod", "pom.xml", "build.gradle",
+        "Makefile", "Dockerfile", "docker-compose.yml",
+        "README.md", "README.rst", ".env.example",
+    ]
+    # Nested {name: subtree} dicts for directories, None for files
+    root: dict = {}
+    source_paths: list[str] = []
+    root_files: set[str] = set()
+
+    for rel_path in list_repo_files(repo_root):
+        *dir_parts, name = rel_path.split("/")
+        if rel_path.startswith(output_prefix) or any(part in tree_skip_dirs for part in dir_parts):
+            continue
+        node = root
+        for part in dir_parts:
+            node = node.setdefault(part, {})
+            if part in scan_skip_dirs:
+                break
+        else:
+            node[name] = None
+            if not dir_parts:
+                root_files.add(name)
+            if (
+                len(source_paths) < MAX_FILES
+                and name.endswith(FILE_EXTENSIONS)
+                and not GENERATED_FILE_RE.search(name)
+            ):
+                source_paths.append(rel_path)
+
+    lines = [repo_root.name + "/"]
+
+    def _render(node: dict, prefix: str, depth: int):
+        # Checked before sorting so nothing is ordered once the budget is spent
+        if depth > max_depth or len(lines) >= max_lines:
             return
-        entries = sorted(path.iterdir(), key=lambda p: (not p.is_dir(), p.name))
-        dirs = [e for e in entries if e.is_dir() and e.name not in skip_dirs]
-        files = [e for e in entries if e.is_file()]
+        dirs: list[str] = []
+        files: list[str] = []
+        for name, child in node.items():
+            (files if child is None else dirs).append(name)
+        dirs.sort()
+        files.sort()
         items = dirs + files
-        for i, item in enumerate(items):
+        for i, name in enumerate(items):
+            # Stop as soon as the line budget is spent instead of rendering the rest
+            if len(lines) >= max_lines:
+                return
             is_last = i == len(items) - 1
             connector = "└── " if is_last else "├── "
-            lines.append(f"{prefix}{connector}{item.name}")
-            if item.is_dir():
+            lines.append(f"{prefix}{connector}{name}")
+            if i < len(dirs):
                 extension = "    " if is_last else "│   "
-                _walk(item, prefix + extension, depth + 1)
+                _render(node[name], prefix + extension, depth + 1)
+
+    _render(root, "", 1)
+
+    # Reads are I/O bound, so overlap them
+    present_configs = [name for name in config_names if name in root_files]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        sources = executor.map(lambda rel_path: _read_source_file(repo_root, rel_path), source_paths)
+        configs = executor.map(lambda name: _read_config_file(repo_root, name), present_configs)
+        sources = [s for s in sources if s is not None]
+        configs = [c for c in configs if c is not None]
+
+    return "\n".join(lines), sources, configs
 
-    lines.append(repo_root.name + "/")
-    _walk(repo_root, "", 1)
-    return "\n".join(lines[:200])
+
+async def get_commits(repo_root: Path, max_commits: int = 100) -> list[dict]:
+    """
+    Read recent commits with a single `git log -z` call.
+    Records are NUL-terminated and fields split on the ASCII unit separator, so
+    subjects containing `|` or bodies spanning several lines parse unambiguously.
+    """
+    returncode, stdout = await run_git(
+        repo_root,
+        "log", "-z",
+        f"--max-count={max_commits}",
+        "--pretty=format:%h%x1f%ad%x1f%an%x1f%s%x1f%b",
+        "--date=short",
+    )
+    if returncode != 0:
+        return []
+
+    commits = []
+    # Decode once; replace rather than fail on commits in legacy encodings
+    for record in stdout.decode("utf-8", errors="replace").split("\x00"):
+        if not record:
+            continue
+        short_hash, date, author, subject, body = record.split("\x1f", 4)
+        commits.append({
+            "hash": short_hash,
+            "date": date,
+            "author": author,
+            "subject": subject,
+            "body": body,
+        })
+    return commits
+
+
+def format_git_log(commits: list[dict], max_commits: int = 50) -> str:
+    """Format recent git history with commit messages."""
+    return "\n".join(
+        f"{c['hash']} | {c['date']} | {c['subject']}" for c in commits[:max_commits]
+    )
+
+
+def format_full_git_log(commits: list[dict]) -> str:
+    """Format git log with full conventional commit detail for changelog generation."""
+    return "\n".join(
+        f"{c['hash']} | {c['date']} | {c['author']} | {c['subject']}\n{c['body']}---"
+        for c in commits
+    )
 
 
 # ---------------------------------------------------------------------------
 # Claude API
 # ---------------------------------------------------------------------------
 
-client = anthropic.Anthropic()
+GENERATION_FAILED = "*Documentation generation failed"
+
+_client = None
+
 
+def get_client():
+    """
+    Return the shared AsyncAnthropic client, importing the SDK on first use so
+    runs where every doc is skipped or cached never pay its import cost.
+    """
+    global _client
+    if _client is None:
+        import anthropic
+        import httpx
+
+        # One client for the whole run: concurrent generator requests multiplex
+        # over a pooled HTTP/2 connection instead of each paying a TLS handshake
+        _client = anthropic.AsyncAnthropic(
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=8, max_connections=16),
+            ),
+        )
+    return _client
 
-def call_claude(system_prompt: str, user_prompt: str) -> str:
-    """Call Claude API and return text response."""
+
+async def call_claude(
+    system_prompt: str,
+    user_prompt: str,
+    repo_context: Optional[str] = None,
+    cache_context: bool = False,
+) -> AsyncIterator[str]:
+    """
+    Call Claude API and yield the response text as it streams in.
+    When repo_context is given it is sent as a system block ahead of the per-doc
+    system prompt, so every doc request shares the same prefix. cache_context
+    marks that block for prompt caching; only worth it when another request in
+    the run will read it, since cache writes cost more than plain input.
+    """
+    system = system_prompt
+    if repo_context:
+        context_block = {"type": "text", "text": repo_context}
+        if cache_context:
+            context_block["cache_control"] = {"type": "ephemeral"}
+        system = [context_block, {"type": "text", "text": system_prompt}]
+    started = False
     try:
-        response = client.messages.create(
+        async with get_client().messages.stream(
             model=MODEL,
             max_tokens=MAX_TOKENS,
-            system=system_prompt,
+            system=system,
             messages=[{"role": "user", "content": user_prompt}],
-        )
-        return response.content[0].text
+        ) as stream:
+            async for text in stream.text_stream:
+                started = True
+                yield text
+            usage = (await stream.get_final_message()).usage
+        if cache_context:
+            print(
+                f"  Prompt cache: {usage.cache_read_input_tokens or 0} tokens read, "
+                f"{usage.cache_creation_input_tokens or 0} written"
+            )
     except Exception as e:
         print(f"  API error: {e}")
-        return f"*Documentation generation failed: {e}*"
+        if started:
+            yield "\n\n"
+        yield f"{GENERATION_FAILED}: {e}*"
 
 
 # ---------------------------------------------------------------------------
@@ -256,26 +423,23 @@ LANG_INSTRUCTION = {
         "a horizontal rule separator."
     ),
 }
+LANG = LANG_INSTRUCTION.get(LANGUAGE, LANG_INSTRUCTION["en"])
 
 
-def generate_architecture(tree: str, configs: list[dict], sources: list[dict]) -> str:
-    """Generate ARCHITECTURE.md"""
-    lang = LANG_INSTRUCTION.get(LANGUAGE, LANG_INSTRUCTION["en"])
-
-    system = f"""You are a senior software architect writing clear documentation.
-{lang}
-Write in Markdown. Be concise but thorough. Use diagrams (Mermaid syntax) where helpful.
-Target audience: a new developer joining the project with no context."""
-
-    source_summary = "\n\n".join(
-        f"### {s['path']}\n```\n{s['content'][:3000]}\n```"
-        for s in sources[:20]
-    )
-    config_summary = "\n\n".join(
+def build_repo_context(tree: str, configs: list[dict], sources: list[dict]) -> str:
+    """
+    Build the repository snapshot shared by the context-based docs.
+    Built once per run so it is byte-identical across calls (required for prompt cache hits).
+    """
+    config_text = "\n\n".join(
         f"### {c['path']}\n```\n{c['content']}\n```" for c in configs
     )
+    source_text = "\n\n".join(
+        f"### {s['path']}\n```\n{s['content']}\n```"
+        for s in sources[:30]
+    )
 
-    user = f"""Analyze this codebase and generate an ARCHITECTURE.md document.
+    return f"""# Repository Snapshot
 
 ## Directory Structure
 ```
@@ -283,10 +447,21 @@ Target audience: a new developer joining the project with no context."""
 ```
 
 ## Config Files
-{config_summary}
+{config_text}
+
+## Source Files
+{source_text}
+"""
+
+
+def architecture_prompts() -> tuple[str, str]:
+    """Build the (system, user) prompts for ARCHITECTURE.md; sent with the repo context."""
+    system = f"""You are a senior software architect writing clear documentation.
+{LANG}
+Write in Markdown. Be concise but thorough. Use diagrams (Mermaid syntax) where helpful.
+Target audience: a new developer joining the project with no context."""
 
-## Source Files (samples)
-{source_summary}
+    user = """Analyze the repository snapshot and generate an ARCHITECTURE.md document.
 
 ## Required Sections
 1. **Project Overview** - What this project does (1-2 sentences a non-technical person can understand)
@@ -297,33 +472,17 @@ Target audience: a new developer joining the project with no context."""
 6. **Data Flow** - How data moves through the system
 7. **Configuration** - Key config files and environment variables
 """
-    return call_claude(system, user)
-
+    return system, user
 
-def generate_api_docs(sources: list[dict], configs: list[dict]) -> str:
-    """Generate API.md"""
-    lang = LANG_INSTRUCTION.get(LANGUAGE, LANG_INSTRUCTION["en"])
 
+def api_docs_prompts() -> tuple[str, str]:
+    """Build the (system, user) prompts for API.md; sent with the repo context."""
     system = f"""You are a technical writer creating API documentation.
-{lang}
+{LANG}
 Write in Markdown. Include code examples for every endpoint/function.
 Target audience: a developer who wants to integrate with or use this project."""
 
-    source_text = "\n\n".join(
-        f"### {s['path']}\n```\n{s['content'][:4000]}\n```"
-        for s in sources[:30]
-    )
-    config_text = "\n\n".join(
-        f"### {c['path']}\n```\n{c['content']}\n```" for c in configs
-    )
-
-    user = f"""Analyze these source files and generate API documentation.
-
-## Config Files
-{config_text}
-
-## Source Files
-{source_text}
+    user = """Analyze the source files in the repository snapshot and generate API documentation.
 
 ## Required Sections
 1. **API Overview** - What this API/library does
@@ -341,33 +500,18 @@ If this is a library (not a web API), document the public interface:
 exported functions, classes, and their methods with usage examples.
 If no clear API is found, document the main entry points and public interfaces.
 """
-    return call_claude(system, user)
+    return system, user
 
 
-def generate_onboarding(tree: str, configs: list[dict], sources: list[dict]) -> str:
-    """Generate ONBOARDING.md"""
-    lang = LANG_INSTRUCTION.get(LANGUAGE, LANG_INSTRUCTION["en"])
-
+def onboarding_prompts(source_paths: str) -> tuple[str, str]:
+    """Build the (system, user) prompts for ONBOARDING.md; sent with the repo context."""
     system = f"""You are writing an onboarding guide for new developers.
-{lang}
+{LANG}
 Write in Markdown. Be extremely friendly and assume zero context.
 Use numbered steps. Include exact commands to copy-paste.
 Target audience: someone who just cloned this repo and has never seen it before."""
 
-    config_text = "\n\n".join(
-        f"### {c['path']}\n```\n{c['content']}\n```" for c in configs
-    )
-    source_paths = "\n".join(f"- {s['path']}" for s in sources)
-
-    user = f"""Create an onboarding guide for this project.
-
-## Directory Structure
-```
-{tree}
-```
-
-## Config Files
-{config_text}
+    user = f"""Create an onboarding guide for the project in the repository snapshot.
 
 ## Source Files Present
 {source_paths}
@@ -385,18 +529,18 @@ Target audience: someone who just cloned this repo and has never seen it before.
 6. **Troubleshooting** - Common issues and fixes
 7. **Where to Get Help** - Links, contacts, channels
 """
-    return call_claude(system, user)
-
+    return system, user
 
-def generate_decisions(git_log: str, configs: list[dict], sources: list[dict]) -> str:
-    """Generate DECISIONS.md from git history."""
-    lang = LANG_INSTRUCTION.get(LANGUAGE, LANG_INSTRUCTION["en"])
 
+def decisions_prompts(git_log: str, configs: list[dict]) -> tuple[str, str]:
+    """Build the (system, user) prompts for DECISIONS.md from git history and config files."""
     system = f"""You are a software historian reconstructing project decisions from git history.
-{lang}
+{LANG}
 Write in Markdown. Use a table format for the decision log.
 Be factual — only infer decisions that are clearly supported by the evidence."""
 
+    # Git history is the evidence here; short config excerpts are enough context,
+    # so this doc does not pay for the full repo snapshot
     config_text = "\n\n".join(
         f"### {c['path']}\n```\n{c['content'][:2000]}\n```" for c in configs
     )
@@ -430,15 +574,13 @@ Generate a DECISIONS.md with:
 
 Only include decisions you can reasonably infer. Mark uncertain inferences with ⚠️.
 """
-    return call_claude(system, user)
+    return system, user
 
 
-def generate_changelog(full_git_log: str) -> str:
-    """Generate CHANGELOG.md from git history using conventional commits."""
-    lang = LANG_INSTRUCTION.get(LANGUAGE, LANG_INSTRUCTION["en"])
-
+def changelog_prompts(full_git_log: str) -> tuple[str, str]:
+    """Build the (system, user) prompts for CHANGELOG.md from git history."""
     system = f"""You are generating a CHANGELOG.md from git history.
-{lang}
+{LANG}
 Write in Markdown. Follow Keep a Changelog format (https://keepachangelog.com).
 Group changes by type: Added, Changed, Fixed, Removed, Security, Deprecated.
 Parse conventional commits (feat:, fix:, chore:, docs:, refactor:, test:, perf:, etc.).
@@ -473,13 +615,131 @@ Format based on [Keep a Changelog](https://keepachangelog.com).
 Group commits into time periods using dates as version markers if no semver tags exist.
 Focus on user-facing changes. Each entry should be one clear sentence.
 """
-    return call_claude(system, user)
+    return system, user
+
+
+# ---------------------------------------------------------------------------
+# Output
+# ---------------------------------------------------------------------------
+
+
+@contextmanager
+def atomic_open(path: Path) -> Iterator[IO[str]]:
+    """
+    Open a temp file next to `path` for writing and rename it over `path` on success.
+    Readers (and the commit step) never see a half-written doc.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Doc Cache
+# ---------------------------------------------------------------------------
+
+CACHE_FILENAME = ".autodoc_cache.json"
+# Content-addressed store of every generated doc, {doc_type}-{input hash}.md.
+# Lives outside the output dir (not committed); CI persists it with actions/cache.
+CACHE_DIR = ".autodoc/cache"
+# Store entries beyond this are evicted least recently used first
+CACHE_MAX_ENTRIES = 100
+
+
+def doc_cache_key(filename: str, prompts: tuple[str, str], repo_context: str = "") -> str:
+    """
+    Hash everything that determines a doc's content: model and request settings
+    plus the rendered system/user prompts and repo context exactly as sent.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (filename, MODEL, str(MAX_TOKENS), *prompts, repo_context):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def copy_doc(src: Path, dest: Path) -> None:
+    """Copy a doc through atomic_open so the destination is never left half-written."""
+    with atomic_open(dest) as f:
+        f.write(src.read_text(encoding="utf-8"))
+
+
+def prune_doc_store(cache_dir: Path, in_use: set[str]) -> None:
+    """
+    Trim the store to CACHE_MAX_ENTRIES docs, dropping the least recently
+    written or restored first. Entries for this run's keys are always kept.
+    """
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.name.endswith(".md")]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[CACHE_MAX_ENTRIES:]:
+        if entry.name not in in_use:
+            os.unlink(entry.path)
+
+
+def load_doc_cache(output_path: Path) -> dict[str, str]:
+    """Load the {filename: input hash} map recorded by the previous run."""
+    try:
+        return json.loads((output_path / CACHE_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_doc_cache(output_path: Path, cache: dict[str, str]) -> None:
+    """Persist the {filename: input hash} map next to the generated docs."""
+    with atomic_open(output_path / CACHE_FILENAME) as f:
+        f.write(json.dumps(cache, indent=2, sort_keys=True) + "\n")
+
+
+# ---------------------------------------------------------------------------
+# Outbound HTTP
+# ---------------------------------------------------------------------------
+
+HTTP_RETRIES = 3
+HTTP_TIMEOUT = 30
+
+
+def _post_json(url: str, payload: dict, headers: Optional[dict] = None) -> int:
+    """
+    POST a JSON payload and return the HTTP status. 429/5xx responses and
+    failures before the request was sent are retried with exponential backoff;
+    anything after it was sent (a dropped connection, a read timeout) is not,
+    since the POST may already have taken effect. The last error is re-raised.
+    """
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json", **(headers or {})},
+        method="POST",
+    )
+    for attempt in range(HTTP_RETRIES - 1):
+        try:
+            with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            if e.code != 429 and e.code < 500:
+                raise
+        except urllib.error.URLError:
+            # urlopen only wraps errors from connecting and sending the request
+            pass
+        time.sleep(0.5 * 2 ** attempt)
+    with urllib.request.urlopen(req, timeout=HTTP_TIMEOUT) as resp:
+        return resp.status
 
 
 # ---------------------------------------------------------------------------
 # PR Comment
 # ---------------------------------------------------------------------------
 
+PR_REF_RE = re.compile(r"refs/pull/(\d+)/")
+
 
 def post_pr_comment(files_generated: list[str], files_skipped: list[str]) -> None:
     """Post a summary comment to the PR if running in a GitHub Actions PR context."""
@@ -488,7 +748,7 @@ def post_pr_comment(files_generated: list[str], files_skipped: list[str]) -> Non
     if GITHUB_EVENT_NAME != "pull_request":
         return
 
-    match = re.match(r"refs/pull/(\d+)/", GITHUB_REF)
+    match = PR_REF_RE.match(GITHUB_REF)
     if not match:
         return
     pr_number = match.group(1)
@@ -505,23 +765,18 @@ def post_pr_comment(files_generated: list[str], files_skipped: list[str]) -> Non
     body += f"\n> Generated by [AutoDoc](https://github.com/kiara-inc/autodoc-action)"
 
     url = f"https://api.github.com/repos/{GITHUB_REPOSITORY}/issues/{pr_number}/comments"
-    payload = json.dumps({"body": body}).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Authorization": f"Bearer {GITHUB_TOKEN}",
-            "Content-Type": "application/json",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28",
-        },
-        method="POST",
-    )
+    headers = {
+        "Authorization": f"Bearer {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
     try:
-        with urllib.request.urlopen(req) as resp:
-            print(f"  PR comment posted (HTTP {resp.status})")
+        status = _post_json(url, {"body": body}, headers)
+        print(f"  PR comment posted (HTTP {status})")
     except urllib.error.HTTPError as e:
         print(f"  Failed to post PR comment: HTTP {e.code} — {e.reason}")
+    except (OSError, http.client.HTTPException) as e:
+        print(f"  Failed to post PR comment: {e}")
 
 
 # ---------------------------------------------------------------------------
@@ -533,6 +788,11 @@ def send_webhook(files_generated: list[str], files_skipped: list[str]) -> None:
     """Send Slack/Discord webhook notification when docs are updated."""
     if not WEBHOOK_URL or not files_generated:
         return
+    # Fail fast on a malformed URL instead of inside urlopen after building the payload
+    parts = urllib.parse.urlsplit(WEBHOOK_URL)
+    if parts.scheme != "https" or not parts.netloc:
+        print("  Webhook skipped: AUTODOC_WEBHOOK_URL must be an https:// URL")
+        return
 
     repo_label = GITHUB_REPOSITORY or "your repo"
     updated = ", ".join(f"`{f}`" for f in files_generated)
@@ -543,18 +803,13 @@ def send_webhook(files_generated: list[str], files_skipped: list[str]) -> None:
         text += f"\n*Skipped (no changes):* {skipped}"
 
     # Slack format — also accepted by Discord incoming webhooks
-    payload = json.dumps({"text": text}).encode("utf-8")
-    req = urllib.request.Request(
-        WEBHOOK_URL,
-        data=payload,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
     try:
-        with urllib.request.urlopen(req) as resp:
-            print(f"  Webhook sent (HTTP {resp.status})")
+        status = _post_json(WEBHOOK_URL, {"text": text})
+        print(f"  Webhook sent (HTTP {status})")
     except urllib.error.HTTPError as e:
         print(f"  Webhook failed: HTTP {e.code} — {e.reason}")
+    except (OSError, http.client.HTTPException) as e:
+        print(f"  Webhook failed: {e}")
 
 
 # ---------------------------------------------------------------------------
@@ -562,7 +817,7 @@ def send_webhook(files_generated: list[str], files_skipped: list[str]) -> None:
 # ---------------------------------------------------------------------------
 
 
-def main():
+async def main():
     print("=" * 60)
     print("  AutoDoc - Self-Documenting Repos")
     print("  Your project documents itself every time you push.")
@@ -574,19 +829,21 @@ def main():
 
     # Scan
     print("\n  Scanning repository...")
-    tree = get_directory_tree(repo_root)
-    configs = scan_config_files(repo_root)
-    sources = scan_source_files(repo_root)
-    git_log = get_git_log(repo_root)
-    full_git_log = get_full_git_log(repo_root)
+    # The file scan (ls-files + reads, on a worker thread) and the git history
+    # queries are independent, so none of them waits on another's fork/exec
+    (tree, sources, configs), commits, changed_files = await asyncio.gather(
+        asyncio.to_thread(scan_repo, repo_root),
+        get_commits(repo_root),
+        get_changed_files(repo_root) if DIFF_MODE else asyncio.sleep(0, result=set()),
+    )
+    git_log = format_git_log(commits)
+    full_git_log = format_full_git_log(commits)
 
     print(f"  Found {len(sources)} source files, {len(configs)} config files")
     print(f"  Git history: {len(git_log.splitlines())} recent commits")
 
     # Diff mode
-    changed_files: set[str] = set()
     if DIFF_MODE:
-        changed_files = get_changed_files(repo_root)
         if changed_files:
             print(f"  Diff mode: {len(changed_files)} files changed since last commit")
         else:
@@ -595,44 +852,141 @@ def main():
     files_generated: list[str] = []
     files_skipped: list[str] = []
 
-    def run_or_skip(doc_type: str, filename: str, generate_fn, *args):
-        if should_regenerate(doc_type, changed_files):
-            content = generate_fn(*args)
-            (output_path / filename).write_text(content, encoding="utf-8")
-            files_generated.append(filename)
-            print(f"  Done")
-        else:
-            files_skipped.append(filename)
-            print(f"  Skipped (no relevant changes)")
+    # Prompt blocks shared across docs are built once per run
+    repo_context = build_repo_context(tree, configs, sources)
+    source_paths = "\n".join(f"- {s['path']}" for s in sources)
 
+    # (doc_type, filename, uses_context, (system, user)); uses_context marks
+    # the docs sent the shared repo-context prefix
+    jobs = []
     if INCLUDE_ARCH:
-        print("\n  Generating ARCHITECTURE.md ...")
-        run_or_skip("architecture", "ARCHITECTURE.md", generate_architecture, tree, configs, sources)
-
+        jobs.append(("architecture", "ARCHITECTURE.md", True, architecture_prompts()))
     if INCLUDE_API:
-        print("\n  Generating API.md ...")
-        run_or_skip("api", "API.md", generate_api_docs, sources, configs)
-
+        jobs.append(("api", "API.md", True, api_docs_prompts()))
     if INCLUDE_ONBOARD:
-        print("\n  Generating ONBOARDING.md ...")
-        run_or_skip("onboarding", "ONBOARDING.md", generate_onboarding, tree, configs, sources)
-
+        jobs.append(("onboarding", "ONBOARDING.md", True, onboarding_prompts(source_paths)))
     if INCLUDE_DECISIONS:
-        print("\n  Generating DECISIONS.md ...")
-        run_or_skip("decisions", "DECISIONS.md", generate_decisions, git_log, configs, sources)
-
+        jobs.append(("decisions", "DECISIONS.md", False, decisions_prompts(git_log, configs)))
     if INCLUDE_CHANGELOG:
-        print("\n  Generating CHANGELOG.md ...")
-        run_or_skip("changelog", "CHANGELOG.md", generate_changelog, full_git_log)
-
-    # Notifications
+        jobs.append(("changelog", "CHANGELOG.md", False, changelog_prompts(full_git_log)))
+
+    # Docs whose inputs hash the same as last run are reused without an API call,
+    # and docs for any previously seen inputs are restored from the CACHE_DIR store
+    cache = load_doc_cache(output_path)
+    cache_dir = repo_root / CACHE_DIR
+    cache_keys: dict[str, str] = {}
+    updated: set[str] = set()
+
+    # Each doc waits on a Claude round-trip, so run them concurrently.
+    # Docs stay separate requests rather than one combined response: they share
+    # the cached repo-context prefix, stream independently, and can be skipped
+    # or cached per doc, while one call would put every doc behind one output budget.
+    pending = []
+    for job in jobs:
+        doc_type, filename, uses_context, prompts = job
+        if not should_regenerate(doc_type, changed_files):
+            files_skipped.append(filename)
+            print(f"\n  Skipping {filename} (no relevant changes)")
+            continue
+        key = cache_keys[filename] = doc_cache_key(
+            filename, prompts, repo_context if uses_context else ""
+        )
+        cached_doc = cache_dir / f"{doc_type}-{key}.md"
+        if cache.get(filename) == key and (output_path / filename).exists():
+            files_skipped.append(filename)
+            print(f"\n  Skipping {filename} (inputs unchanged since last run)")
+        elif cached_doc.exists():
+            print(f"\n  Restoring {filename} from cache ...")
+            copy_doc(cached_doc, output_path / filename)
+            os.utime(cached_doc)  # mark as recently used for prune_doc_store
+            cache[filename] = key
+            updated.add(filename)
+        else:
+            print(f"\n  Generating {filename} ...")
+            pending.append(job)
+
+    # Concurrent requests only hit the prompt cache once an earlier request has
+    # written it, and it is readable as soon as that response starts streaming.
+    # So the first repo-context doc primes the cache and the other context docs
+    # wait for its first chunk; docs without the context start straight away.
+    # With a single context doc nothing would read the cache entry, so it is not written.
+    primer = None
+    cache_primed = asyncio.Event()
+    context_jobs = [job for job in pending if job[2]]
+    cache_context = len(context_jobs) > 1
+    if cache_context:
+        primer = context_jobs[0]
+    else:
+        cache_primed.set()
+
+    async def write_doc(
+        filename: str, uses_context: bool, prompts: tuple[str, str], primes_cache: bool
+    ) -> bool:
+        """Stream a generated doc to disk; return False if generation failed."""
+        if uses_context and not primes_cache:
+            await cache_primed.wait()
+        context = repo_context if uses_context else None
+        ok = True
+        try:
+            with atomic_open(output_path / filename) as f:
+                async for chunk in call_claude(*prompts, context, uses_context and cache_context):
+                    if primes_cache:
+                        cache_primed.set()
+                    f.write(chunk)
+                    if chunk.startswith(GENERATION_FAILED):
+                        ok = False
+        finally:
+            # Never leave the waiting docs blocked, even if this one failed
+            if primes_cache:
+                cache_primed.set()
+        print(f"  Done: {filename}")
+        return ok
+
+    if pending:
+        results = await asyncio.gather(
+            *(write_doc(*job[1:], primes_cache=job is primer) for job in pending),
+            return_exceptions=True,
+        )
+        for (doc_type, filename, *_), result in zip(pending, results):
+            if isinstance(result, BaseException):
+                print(f"  Failed to write {filename}: {result}")
+                cache.pop(filename, None)
+                continue
+            updated.add(filename)
+            if result:
+                cache[filename] = cache_keys[filename]
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                copy_doc(output_path / filename, cache_dir / f"{doc_type}-{cache_keys[filename]}.md")
+            else:
+                cache.pop(filename, None)
+
+    if pending or updated:
+        save_doc_cache(output_path, cache)
+    prune_doc_store(cache_dir, {
+        f"{doc_type}-{cache_keys[filename]}.md"
+        for doc_type, filename, *_ in jobs if filename in cache_keys
+    })
+    # Report in job order rather than completion order
+    files_generated.extend(filename for _, filename, *_ in jobs if filename in updated)
+
+    # Notifications — independent POSTs, so send them concurrently
+    notifications = []
     if GITHUB_EVENT_NAME == "pull_request":
         print("\n  Posting PR comment...")
-        post_pr_comment(files_generated, files_skipped)
+        notifications.append(("PR comment", post_pr_comment))
 
     if WEBHOOK_URL:
         print("\n  Sending webhook notification...")
-        send_webhook(files_generated, files_skipped)
+        notifications.append(("webhook", send_webhook))
+
+    # A failed notification must not stop the Actions outputs below from being written
+    results = await asyncio.gather(
+        *(asyncio.to_thread(notify, files_generated, files_skipped) for _, notify in notifications),
+        return_exceptions=True,
+    )
+    for (label, _), result in zip(notifications, results):
+        if isinstance(result, BaseException):
+            print(f"  Failed to send {label}: {result}")
 
     # GitHub Actions outputs
     github_output = os.environ.get("GITHUB_OUTPUT")
@@ -652,4 +1006,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())